@@ -4,7 +4,7 @@
 """
 
 import sys
-import subprocess
+import shutil
 import importlib.util
 
 
@@ -21,31 +21,32 @@ def check_python_version():
 
 def check_module_installed(module_name):
     """Проверяет, установлен ли модуль"""
-    try:
-        importlib.util.find_spec(module_name)
+    # Уже загруженный модуль не требует поиска через finders
+    if module_name in sys.modules:
+        installed = True
+    else:
+        try:
+            # find_spec возвращает None, если модуль не найден
+            installed = importlib.util.find_spec(module_name) is not None
+        except (ImportError, ValueError):
+            installed = False
+
+    if installed:
         print(f"✅ Модуль {module_name} установлен")
-        return True
-    except ImportError:
+    else:
         print(f"❌ Модуль {module_name} не найден")
-        return False
+    return installed
 
 
 def check_executable_exists(cmd):
     """Проверяет, существует ли исполняемый файл"""
-    try:
-        result = subprocess.run([cmd, "--help"], capture_output=True, text=True, timeout=5)
-        if result.returncode == 0:
-            print(f"✅ Команда {cmd} работает")
-            return True
-        else:
-            print(f"❌ Команда {cmd} завершилась с ошибкой")
-            return False
-    except FileNotFoundError:
+    # Ищем команду в PATH, не запуская её: meshchat при старте подключается к устройству
+    path = shutil.which(cmd)
+    if path is None:
         print(f"❌ Команда {cmd} не найдена")
         return False
-    except subprocess.TimeoutExpired:
-        print(f"⚠️  Команда {cmd} превысила время ожидания")
-        return False
+    print(f"✅ Команда {cmd} найдена: {path}")
+    return True
 
 
 def main():
@@ -57,7 +58,8 @@ def main():
     print()
 
     # Проверяем зависимости
-    modules_to_check = ["meshcore", "prompt_toolkit", "pycryptodome"]
+    # pycryptodome устанавливается как пакет Crypto
+    modules_to_check = ["meshcore", "prompt_toolkit", "Crypto"]
     modules_ok = all(check_module_installed(module) for module in modules_to_check)
     print()
 
@@ -1,12 +1,16 @@
 """
 Configuration handling for MeshChat application
 """
+import functools
 import json
+import os
 from pathlib import Path
+from .constants import ANSI_BCYAN, ANSI_GREEN, ANSI_BRED, ANSI_BGREEN, ANSI_END
 
 
+@functools.lru_cache(maxsize=1)
 def get_config_path():
-    """Get the configuration file path"""
+    """Get the configuration file path (the directory is created on first call)"""
     home_dir = Path.home()
     config_dir = home_dir / ".config" / "meshcore"
     config_dir.mkdir(parents=True, exist_ok=True)
@@ -18,9 +22,11 @@ def load_config():
     config_path = get_config_path()
     if config_path.exists():
         try:
-            with open(config_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (json.JSONDecodeError, IOError):
+            # json.loads accepts bytes and detects the encoding itself
+            data = config_path.read_bytes()
+            if data.strip():
+                return json.loads(data)
+        except (json.JSONDecodeError, UnicodeDecodeError, IOError):
             pass
     return {}
 
@@ -28,16 +34,24 @@ def load_config():
 def save_config(config):
     """Save configuration to file"""
     config_path = get_config_path()
+    tmp_path = config_path.with_suffix('.json.tmp')
     try:
-        with open(config_path, 'w', encoding='utf-8') as f:
-            json.dump(config, f, indent=2)
+        # Serialize in memory for a single write, then swap the file in
+        # atomically so a crash can't leave a truncated config behind
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(config, indent=2))
+        os.replace(tmp_path, config_path)
     except IOError as e:
         print(f"Error saving configuration: {e}")
+        # Don't leave a partial temporary file next to the config
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
 
 
 def get_connection_params():
     """Get connection parameters from config or user input"""
-    from .constants import ANSI_BCYAN, ANSI_GREEN, ANSI_BRED, ANSI_BGREEN, ANSI_END
     config = load_config()
 
     # Check if config has required parameters
@@ -5,38 +5,140 @@ Supports sending messages in the format #channel: message
 """
 
 import asyncio
+import collections
+import functools
 import hashlib
 import logging
+import os
 import re
-from datetime import datetime
 
 from prompt_toolkit import Application
 from prompt_toolkit.buffer import Buffer
+from prompt_toolkit.document import Document
 from prompt_toolkit.layout import Layout, HSplit, Window, FormattedTextControl
 from prompt_toolkit.layout.controls import BufferControl
 from prompt_toolkit.widgets import TextArea, Frame
 from prompt_toolkit.key_binding import KeyBindings
-from prompt_toolkit.formatted_text import ANSI
 from meshcore import MeshCore, EventType
 
-from .constants import ANSI_BOLD, ANSI_BCYAN, ANSI_END, ANSI_BMAGENTA, ANSI_BRED
+from .constants import ANSI_BOLD, ANSI_BCYAN, ANSI_END, ANSI_BRED
 from .config import get_connection_params
-from .messages import process_event_message, recent_channels, load_all_history, clean_history_files, send_message, show_available_channels_and_users
+from .messages import process_event_message, recent_channels, add_recent_names, load_all_history, clean_history_files, send_message, show_available_channels_and_users, flush_history
+
+# ANSI escape sequences, stripped before text reaches the prompt_toolkit buffer
+_ANSI_RE = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
+
+# Startup banner, plus its ANSI-free form so append_output can skip the strip
+_BANNER_TITLE = f"{'MESHCORE MESSENGER CLIENT':^78}".rstrip()
+_BANNER = (
+    f"{ANSI_BOLD}{ANSI_BCYAN}╔{'═' * 78}╗{ANSI_END}\n"
+    f"{ANSI_BOLD}{ANSI_BCYAN}║{ANSI_END}{_BANNER_TITLE}{ANSI_BOLD}{ANSI_BCYAN}║{ANSI_END}\n"
+    f"{ANSI_BOLD}{ANSI_BCYAN}╚{'═' * 78}╝{ANSI_END}"
+)
+_BANNER_PLAIN = _ANSI_RE.sub('', _BANNER)
+
+# User input in the form "#channel: message" or "@contact: message"
+_CMD_RE = re.compile(r'([^:]+):\s*(.+)', re.DOTALL)
+_HELP_COMMANDS = frozenset(('help', '/help'))
+
+# Number of output fragments kept on screen, unless overridden by the
+# MESH_CHAT_SCROLLBACK environment variable; older ones are dropped
+_DEFAULT_SCROLLBACK = 5000
+
+# Minimum time between two screen redraws, in seconds. Bursts of appended
+# messages (history replay, busy channels) are coalesced into one frame.
+_MIN_REDRAW_INTERVAL = 0.03
+
+
+@functools.lru_cache(maxsize=4)
+def _format_status_bar(connected, last_message_status, device_name, host, port, term_width):
+    """Build the status bar fragments; cached because they only change with the inputs"""
+    status_indicator = '●'  # Circle symbol
+    status_color = 'ansigreen' if connected else 'ansired'
+    status_text = 'CONNECTED' if connected else 'DISCONNECTED'
+
+    # Include the last message status if available
+    left_side = f' {status_indicator} {status_text}'
+    if last_message_status:
+        left_side += f' | MSG: {last_message_status}'
+
+    # Add the instruction text to the left side
+    instruction_text = "Use: #channel: msg or @contact: msg"
+    left_side += f' | {instruction_text}'
+
+    right_side = f'Device: {device_name} | {host}:{port}'
+
+    # Split the left side so only the connection status part is colored
+    parts = left_side.split(' | ')
+    formatted_parts = []
+
+    for i, part in enumerate(parts):
+        formatted_parts.append((f'{status_color} bold' if i == 0 else '', part))
+
+        # Add separator except for the last element
+        if i < len(parts) - 1:
+            formatted_parts.append(('', ' | '))
+
+    # Return as a single formatted line with left and right aligned content
+    return formatted_parts + [
+        ('', ' ' * (term_width - len(left_side) - len(right_side))),  # Spacer
+        ('', right_side)
+    ]
+
+
+# Fixed right-hand part of the instruction bar
+_INSTRUCTION_HINT = "Press Ctrl+C to exit or type '/help' to see available channels/users"
+_INSTRUCTION_HINT_FRAGMENT = ('', _INSTRUCTION_HINT)
+
+
+@functools.lru_cache(maxsize=4)
+def _format_instruction_bar(last_message_status, term_width):
+    """Build the instruction bar fragments; cached like the status bar"""
+    # Left side shows the status of the last sent message
+    left_side = f"Last message: {last_message_status if last_message_status else 'No message sent yet'}"
+
+    # Calculate spacing to align the right side content
+    total_len = len(left_side) + len(_INSTRUCTION_HINT)
+
+    if total_len < term_width:
+        spacer = ' ' * (term_width - total_len - 2)  # -2 for potential edge spaces
+    else:
+        spacer = ' '  # Minimal spacing if text is too long for terminal
+
+    # Return as a single formatted line with left and right aligned content
+    return [
+        ('', left_side),
+        ('', spacer),
+        _INSTRUCTION_HINT_FRAGMENT
+    ]
 
 
 class MeshChatApp:
     def __init__(self):
-        self.output_buffer = ""
+        # Every appended fragment as given, and its ANSI-stripped copy for the
+        # output buffer; both are joined only when read or rendered, and only
+        # the last scrollback fragments are kept
+        scrollback = self._scrollback_size()
+        self._output_chunks = collections.deque(maxlen=scrollback)
+        self._output_lines = collections.deque(maxlen=scrollback)
+        # Set when output was appended since the buffer was last updated, and
+        # the pending loop callback that will update it
+        self._output_dirty = False
+        self._output_sync_handle = None
         self.mc = None
         self.received_messages = []
-        # Queue for incoming messages to be processed by the UI thread
-        self.message_queue = asyncio.Queue()
+        # Incoming message events waiting to be processed by the UI task;
+        # _message_event wakes the consumer (new messages or shutdown)
+        self.message_queue = collections.deque()
+        self._message_event = asyncio.Event()
         # Connection status
         self.connected = False
         self.device_name = "Unknown"
         self.host = "unknown"
         self.port = "unknown"
         self.last_message_status = ""  # Status of the last sent message
+        # Terminal width shared by the status and instruction bars
+        self._term_width = self._query_terminal_width()
 
         # Create the input buffer
         self.input_field = TextArea(
@@ -56,19 +158,10 @@ class MeshChatApp:
             Press Ctrl+C or Ctrl+Q to exit
             """
             # Add exit message to the output
-            exit_msg = f"{ANSI_BCYAN}Shutting down MeshChat...{ANSI_END}"
-            if hasattr(self, 'output_buffer'):
-                if self.output_buffer:
-                    self.output_buffer += "\n"
-                self.output_buffer += exit_msg
-                # Update the buffer content
-                from prompt_toolkit.document import Document
-                # Process ANSI codes to make them work with prompt_toolkit
-                processed_text = self.process_ansi_codes(self.output_buffer)
-                self.output_buffer_obj.reset(Document(processed_text))
+            self.append_output(f"{ANSI_BCYAN}Shutting down MeshChat...{ANSI_END}")
 
             # Stop message processing
-            self.processing_messages = False
+            self.stop_message_processing()
             # Close the meshcore connection
             if self.mc:
                 try:
@@ -128,112 +221,121 @@ class MeshChatApp:
             layout=Layout(root_container, focused_element=self.input_field),
             key_bindings=kb,
             full_screen=True,
+            before_render=self._before_render,
+            min_redraw_interval=_MIN_REDRAW_INTERVAL,
         )
 
 
-    def append_output(self, text):
-        """Append text to the output buffer"""
-        if self.output_buffer:
-            self.output_buffer += "\n"
+    def append_output(self, text, plain_text=None):
+        """Append text to the output buffer
 
+        plain_text may carry the text already stripped of ANSI codes
+        (e.g. for constants), in which case it is used as-is.
+        """
         # Simply append the text as-is
-        self.output_buffer += text
+        self._output_chunks.append(text)
+
+        # Only the new fragment needs its ANSI codes stripped; everything
+        # appended earlier is already stored in clean form
+        if plain_text is None:
+            plain_text = self.process_ansi_codes(text)
+        self._output_lines.append(plain_text)
+        # The buffer text is rebuilt once per burst, in _sync_output_buffer
+        self._output_dirty = True
+        self._request_redraw()
+
+    def extend_output(self, lines):
+        """Append several lines at once, e.g. replayed history, with one refresh request"""
+        lines = list(lines)
+        self._output_chunks.extend(lines)
+        self._output_lines.extend(map(self.process_ansi_codes, lines))
+        self._output_dirty = True
+        self._request_redraw()
+
+    def _request_redraw(self):
+        """Schedule one buffer update for everything appended in this burst"""
+        if self._output_sync_handle is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # No event loop to defer to (tests, before startup): update now
+            self._sync_output_buffer()
+            return
+        self._output_sync_handle = loop.call_soon(self._sync_output_buffer)
+
+    def _sync_output_buffer(self):
+        """Bring the output buffer up to date and request a refresh
+
+        Runs outside the render pass: the buffer's change events invalidate
+        the application, which must not happen while a frame is being drawn
+        or a second, identical frame follows. prompt_toolkit merges refresh
+        requests and spaces frames by _MIN_REDRAW_INTERVAL.
+        """
+        self._output_sync_handle = None
+        if self._output_dirty:
+            self._output_dirty = False
+            # set_document only swaps text and cursor (kept at the end, so the view
+            # follows new output); reset() would also rebuild all editing state
+            self.output_buffer_obj.set_document(Document("\n".join(self._output_lines)), bypass_readonly=True)
+        try:
+            self.app.invalidate()
+        except Exception:
+            # If direct invalidation fails, continue anyway
+            pass
 
-        # Update the buffer content
-        # Convert the text to document format for the buffer
-        from prompt_toolkit.document import Document
-        # Process ANSI codes to make them work with prompt_toolkit
-        processed_text = self.process_ansi_codes(self.output_buffer)
-        self.output_buffer_obj.reset(Document(processed_text))
+    @property
+    def output_buffer(self):
+        """All output appended so far, one fragment per line"""
+        return "\n".join(self._output_chunks)
 
-        # Force refresh of the application to show the new content
-        if hasattr(self, 'app'):
-            try:
-                self.app.invalidate()
-            except Exception as e:
-                # If direct invalidation fails, continue anyway
-                pass
+    def _before_render(self, app=None):
+        """Bring the terminal width up to date for the next frame"""
+        self._refresh_terminal_width()
+
+    @staticmethod
+    def _scrollback_size():
+        """Number of output fragments to keep, from MESH_CHAT_SCROLLBACK"""
+        try:
+            size = int(os.environ.get('MESH_CHAT_SCROLLBACK', _DEFAULT_SCROLLBACK))
+        except ValueError:
+            return _DEFAULT_SCROLLBACK
+        return size if size > 0 else _DEFAULT_SCROLLBACK
 
     def get_status_bar(self):
         """Get the formatted status bar content"""
-        status_indicator = '●'  # Circle symbol
-        status_color = 'ansigreen' if self.connected else 'ansired'
-        status_text = 'CONNECTED' if self.connected else 'DISCONNECTED'
-
-        # Include the last message status if available
-        left_side = f' {status_indicator} {status_text}'
-        if self.last_message_status:
-            left_side += f' | MSG: {self.last_message_status}'
-
-        # Add the instruction text to the left side
-        instruction_text = "Use: #channel: msg or @contact: msg"
-        left_side += f' | {instruction_text}'
-
-        right_side = f'Device: {self.device_name} | {self.host}:{self.port}'
-
-        # Split the left side to apply different formatting to the instruction text
-        parts = left_side.split(' | ')
-        formatted_parts = []
-
-        for i, part in enumerate(parts):
-            if "Use format:" in part:
-                # Instruction text should be white
-                formatted_parts.append(('', part))
-            else:
-                # Status text should be colored
-                if i == 0:  # This is the connection status part
-                    formatted_parts.append((f'{status_color} bold', part))
-                else:
-                    formatted_parts.append(('', part))
-
-            # Add separator except for the last element
-            if i < len(parts) - 1:
-                formatted_parts.append(('', ' | '))
-
-        # Return as a single formatted line with left and right aligned content
-        return formatted_parts + [
-            ('', ' ' * (self.get_terminal_width() - len(left_side) - len(right_side))),  # Spacer
-            ('', right_side)
-        ]
+        return _format_status_bar(self.connected, self.last_message_status, self.device_name,
+                                  self.host, self.port, self.get_terminal_width())
 
     def get_terminal_width(self):
         """Get the terminal width for alignment purposes"""
+        return self._term_width
+
+    def _refresh_terminal_width(self):
+        """Re-read the terminal width once per frame, before the bars are rendered"""
+        self._term_width = self._query_terminal_width()
+
+    @staticmethod
+    def _query_terminal_width():
+        """Query the terminal width from the OS"""
         try:
-            import os
-            width = os.get_terminal_size().columns
-            return width
+            return os.get_terminal_size().columns
         except OSError:
             # If we can't get terminal size, return a default value
             return 80
 
     def get_instruction_bar(self):
         """Get the formatted instruction bar content"""
-        # Left side shows the status of the last sent message
-        left_side = f"Last message: {self.last_message_status if self.last_message_status else 'No message sent yet'}"
-        right_side = "Press Ctrl+C to exit or type '/help' to see available channels/users"
-
-        # Calculate spacing to align the right side content
-        total_len = len(left_side) + len(right_side)
-        term_width = self.get_terminal_width()
-
-        if total_len < term_width:
-            spacer = ' ' * (term_width - total_len - 2)  # -2 for potential edge spaces
-        else:
-            spacer = ' '  # Minimal spacing if text is too long for terminal
-
-        # Return as a single formatted line with left and right aligned content
-        return [
-            ('', left_side),
-            ('', spacer),
-            ('', right_side)
-        ]
+        return _format_instruction_bar(self.last_message_status, self.get_terminal_width())
 
     def process_ansi_codes(self, text):
         """Remove ANSI codes from text since prompt_toolkit handles formatting differently"""
-        import re
-        # Remove ANSI escape codes using regex
-        ansi_escape = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
-        return ansi_escape.sub('', text)
+        # Plain text needs no regex scan at all, and the prefix before the
+        # first escape character can be kept without scanning it again
+        idx = text.find('\x1b')
+        if idx < 0:
+            return text
+        return text[:idx] + _ANSI_RE.sub('', text[idx:])
 
     def handle_user_input(self, app):
         """Process user input from the input field"""
@@ -245,12 +347,12 @@ class MeshChatApp:
             self.append_output(f"{ANSI_BCYAN}Hint: Use format #channel: message to send messages{ANSI_END}")
             return
 
-        if user_input.lower() == '/help':
+        if user_input.lower() in _HELP_COMMANDS:
             show_available_channels_and_users(self.append_output)
             return
 
         # Parse input in format #channel: message or @contact: message
-        match = re.match(r'^([^:]+):\s*(.+)$', user_input.strip())
+        match = _CMD_RE.fullmatch(user_input)
         if match:
             target = match.group(1).strip()
             message_text = match.group(2).strip()
@@ -260,6 +362,31 @@ class MeshChatApp:
         else:
             self.append_output(f"{ANSI_BRED}Invalid format. Use: #channel_name: message or @contact_name: message{ANSI_END}")
 
+    @staticmethod
+    def _read_history_files():
+        """Clean history files and return the last scrollback messages in
+        chronological order, along with the (channel, user) names found in them"""
+        # Clean history files by removing duplicates
+        clean_history_files()
+        # Older lines would only be dropped from the scrollback again
+        lines = collections.deque(maxlen=MeshChatApp._scrollback_size())
+        # Each name pair once, ordered by when it was last seen
+        names = collections.OrderedDict()
+
+        def add_names(channel, user):
+            names[channel, user] = None
+            names.move_to_end((channel, user))
+
+        # Runs in a worker thread: collect the names and leave the recent
+        # sets to the event loop
+        load_all_history(lines.append, add_names)
+        return list(lines), list(names)
+
+    def stop_message_processing(self):
+        """Stop the message loop, waking it up if it is waiting for a message"""
+        self.processing_messages = False
+        self._message_event.set()
+
     async def load_device_history(self, mc):
         """Load message history from the device"""
         # Skip verbose output for these operations
@@ -286,11 +413,7 @@ class MeshChatApp:
     async def run(self):
         """Run the main application"""
         # Print initial header
-        header = f"{ANSI_BOLD}{ANSI_BCYAN}╔" + "═" * 78 + f"╗{ANSI_END}\n"
-        title = f"{'MESHCORE MESSENGER CLIENT':^78}\n"
-        header += f"{ANSI_BOLD}{ANSI_BCYAN}║{ANSI_END}{title.rstrip()}{ANSI_BOLD}{ANSI_BCYAN}║{ANSI_END}\n"
-        header += f"{ANSI_BOLD}{ANSI_BCYAN}╚" + "═" * 78 + f"╝{ANSI_END}"
-        self.append_output(header)
+        self.append_output(_BANNER, _BANNER_PLAIN)
 
         # Get connection parameters
         host, port = get_connection_params()
@@ -310,6 +433,8 @@ class MeshChatApp:
         if res.type == EventType.ERROR:
             self.append_output(f"{ANSI_BCYAN}Error while querying device: {res}{ANSI_END}")
             return
+        # Number of channel slots, reported by firmware v3 and newer
+        max_channels = res.payload.get('max_channels')
 
         self.append_output(f"{ANSI_BCYAN}Connected to {self.mc.self_info['name']}{ANSI_END}")
         # Update connection status
@@ -319,20 +444,28 @@ class MeshChatApp:
         if hasattr(self, 'app'):
             self.app.invalidate()
 
+        # History files don't depend on the device, so deduplicate and read
+        # them in a worker thread while the contact/channel queries are in flight
+        history_task = asyncio.get_running_loop().run_in_executor(None, self._read_history_files)
+
         # Ensure contacts are loaded first
         await self.mc.ensure_contacts()
 
         # Fetch channels if available
         try:
             # Load all channels to populate mc.channels
+            # Requests stay sequential: replies are matched by event type only,
+            # so concurrent get_channel calls would receive each other's answers.
+            # Knowing max_channels saves the final round trip that ends in ERROR.
             channels = []
             ch_idx = 0
-            while True:
+            while max_channels is None or ch_idx < max_channels:
                 res = await self.mc.commands.get_channel(ch_idx)
                 if res.type == EventType.ERROR:
                     break
                 info = res.payload
-                info["channel_hash"] = hashlib.sha256(info["channel_secret"]).hexdigest()[0:2]
+                # The hash is the first SHA-256 byte; format just that byte
+                info["channel_hash"] = f"{hashlib.sha256(info['channel_secret']).digest()[0]:02x}"
                 info["channel_secret"] = info["channel_secret"].hex()
                 channels.append(info)
                 ch_idx += 1
@@ -351,20 +484,21 @@ class MeshChatApp:
             self.append_output(f"{ANSI_BCYAN}Error loading channels: {e}{ANSI_END}")
             pass  # Channels may not be available
 
-        # Clean history files by removing duplicates
-        clean_history_files()
-
-        # Load history from files first (to show older messages first)
+        # Show history from files first (to show older messages first)
         self.append_output(f"{ANSI_BCYAN}Loading message history from files...{ANSI_END}")
-        load_all_history(self.append_output)
+        history_lines, history_names = await history_task
+        self.extend_output(history_lines)
+        for channel_name, user_name in history_names:
+            add_recent_names(channel_name, user_name)
 
         # Then load history from device
         await self.load_device_history(self.mc)
 
         # Subscribe to message events
         async def handle_message(event):
-            # Put the event in the queue to be processed by the UI thread
-            await self.message_queue.put(('message', event))
+            # Put the event in the queue to be processed by the UI task
+            self.message_queue.append(event)
+            self._message_event.set()
 
         # Subscribe to both private and channel messages
         self.mc.subscribe(EventType.CONTACT_MSG_RECV, handle_message)
@@ -379,35 +513,25 @@ class MeshChatApp:
 
         async def process_message_queue():
             while self.processing_messages:
-                try:
-                    # Wait for a message from the queue with timeout to allow checking exit condition
-                    msg_type, event = await asyncio.wait_for(self.message_queue.get(), timeout=0.5)
+                # Sleep until messages arrive or shutdown is requested
+                await self._message_event.wait()
+                self._message_event.clear()
 
-                    if msg_type == 'message':
+                # Drain everything that arrived meanwhile in one go
+                while self.message_queue:
+                    event = self.message_queue.popleft()
+                    try:
                         # Process the message and add to UI
                         process_event_message(self.mc, event, self.append_output)
-
-                    self.message_queue.task_done()
-                except asyncio.TimeoutError:
-                    # Timeout occurred, continue to check if we should exit
-                    # Also check connection status periodically
-                    try:
-                        # Check if connection is still alive using meshcore's methods
-                        # We'll check if the connection is still active by trying to send a ping or similar
-                        # For now, we'll just continue without changing the status unless we detect disconnection
-                        # The actual disconnection detection would be handled by meshcore events
-                        pass
-                    except:
-                        # If we encounter an error, don't change the status
-                        pass
-                    continue
-                except Exception as e:
-                    # Log the error but continue processing
-                    print(f"Error processing message: {e}")
+                    except Exception as e:
+                        # Log the error but continue processing
+                        print(f"Error processing message: {e}")
 
         # Create tasks for both the UI and message processing
         ui_task = asyncio.create_task(self.app.run_async())
         msg_task = asyncio.create_task(process_message_queue())
+        # However the UI exits, wake the message loop so it can finish too
+        ui_task.add_done_callback(lambda _: self.stop_message_processing())
 
         # Wait for both tasks (UI will finish when closed)
         try:
@@ -417,7 +541,9 @@ class MeshChatApp:
             pass
         finally:
             # Ensure message processing stops
-            self.processing_messages = False
+            self.stop_message_processing()
+            # Write out history lines still buffered
+            flush_history()
 
         # Close the meshcore connection
         if self.mc:
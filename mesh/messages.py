@@ -1,120 +1,365 @@
 """
 Message handling for MeshChat application
 """
+import asyncio
+import atexit
+import bisect
+import collections
 import datetime
+import functools
+import hashlib
+import heapq
+import os
 import re
+import shutil
+import tempfile
+import time
 from pathlib import Path
+from meshcore import EventType
 from prompt_toolkit.formatted_text import ANSI
-from .constants import (
-    ANSI_BCYAN, ANSI_GREEN, ANSI_BLUE, ANSI_BBLUE, ANSI_BYELLOW,
-    ANSI_BGREEN, ANSI_BRED, ANSI_GREY, ANSI_END
-)
+from .constants import ANSI_BCYAN, ANSI_GREEN, ANSI_BLUE, ANSI_BRED, ANSI_END
+
+
+# Debug logging is switched on by the DEBUG environment variable at startup
+_DEBUG_ENABLED = os.environ.get('DEBUG', '').lower() in ('true', '1', 'yes', 'on')
+# debug.log handle, opened on the first debug message
+_debug_file = None
 
 
 def log_debug(message):
     """Log debug information to debug.log file if DEBUG environment variable is set"""
-    import os
-    if os.environ.get('DEBUG', '').lower() in ('true', '1', 'yes', 'on'):
-        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
-        with open("debug.log", "a", encoding="utf-8") as f:
-            f.write(f"[{timestamp}] {message}\n")
+    global _debug_file
+    if not _DEBUG_ENABLED:
+        return
+    if _debug_file is None:
+        # Line buffered, so each message reaches the file as it's logged
+        _debug_file = open("debug.log", "a", encoding="utf-8", buffering=1)
+        atexit.register(_debug_file.close)
+    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+    _debug_file.write(f"[{timestamp}] {message}\n")
+
+
+# Read buffer for history files; startup reads every log end to end
+_READ_BUFFER_SIZE = 1 << 16
+
+# "[timestamp] rest of the line" at the start of a history line
+_TS_BRACKET_RE = re.compile(r'^\[([^\]]+)\]\s*(.*)')
+# Time-only timestamps: "HH:MM:SS" or "HH:MM"
+_TIME_ONLY_RE = re.compile(r'^(\d{1,2}):(\d{2})(?::(\d{2}))?$')
+
+# The format this client writes, "17-Jan-26 22:46:29", parsed without strptime
+_FAST_TS_RE = re.compile(r'(\d{1,2})-([A-Za-z]{3})-(\d{2}) (\d{2}):(\d{2}):(\d{2})')
+_MONTH_NUM = {
+    'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6,
+    'Jul': 7, 'Aug': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12
+}
+
+# "#channel: [user] text" after a history line's timestamp -> channel, user
+_CHAN_USER_RE = re.compile(r'#([^:]+):\s*\[([^\]]+)\]')
+
+# A whole history line in the client's own format, matched in one pass:
+# timestamp fields, then channel and user when present
+_FAST_LINE_RE = re.compile(
+    r'\[(\d{1,2})-([A-Za-z]{3})-(\d{2}) (\d{2}):(\d{2}):(\d{2})\]\s*(?:#([^:]+):\s*\[([^\]]+)\])?')
+
+# A history line split into its parts by _parse_history_line
+_ParsedLine = collections.namedtuple('ParsedLine', ['timestamp', 'channel', 'user'])
+
+# "Name: message" channel text: the part before the first ": ", at most
+# 30 characters, is taken as the sender
+_SENDER_RE = re.compile(r'((?:(?!: ).){1,30}): (.*)', re.DOTALL)
+# A sender name has at least one letter, digit or one of @ . _ -
+_VALID_SENDER_RE = re.compile(r'[\w@.\-]')
+
+# strptime formats tried in order, the one this client writes first
+_TIMESTAMP_FORMATS = (
+    "%d-%b-%y %H:%M:%S",  # Original format: 17-Jan-26 22:46:29
+    "%d-%B-%y %H:%M:%S",  # Full month name: 17-January-26 22:46:29
+    "%m/%d/%y %H:%M:%S",  # MM/DD/YY: 01/17/26 22:46:29
+    "%d/%m/%y %H:%M:%S",  # DD/MM/YY: 17/01/26 22:46:29
+    "%Y-%m-%d %H:%M:%S",  # YYYY-MM-DD: 2026-01-17 22:46:29
+    "%m-%d-%Y %H:%M:%S",  # MM-DD-YYYY: 01-17-2026 22:46:29
+)
+
+
+# Directory holding one <channel>.log file per channel; read on every call,
+# so it can be pointed elsewhere (e.g. by tests)
+HISTORY_DIR = Path("history")
+# The HISTORY_DIR already created, to skip the mkdir on later saves
+_history_dir_ready = None
+
+# Write buffer for the pooled history file handles
+_WRITE_BUFFER_SIZE = 8192
+# Append handles kept open per history file, keyed by path, as
+# (file, (st_dev, st_ino)) so a replaced file is noticed and reopened
+_history_files = {}
+
+# Delay before lines buffered by save_to_history are flushed, so a burst of
+# messages costs one write per file
+_HISTORY_FLUSH_DELAY = 0.5
+# History files written since the last flush, keyed by path, and the timer
+# that will flush them along with the loop it was scheduled on
+_pending_history_writes = {}
+_history_flush_handle = None
+_history_flush_loop = None
+
+# Digests (see _line_digest) of the messages already present in each history
+# file, keyed by file path, so that saving a message doesn't re-read the whole
+# log. Each entry also holds the file's stat signature; any change made by
+# someone else invalidates it.
+_history_cache = {}
+
+
+# Last formatted message timestamp as [epoch second, string]; the format has
+# one-second resolution, so messages within the same second share it
+_last_timestamp = [None, ""]
+
+# Channel name -> index lookup for send_message, built from mc.channels
+_channel_index_cache = {'channels': None, 'size': None, 'map': {}}
+
+
+# pubkey prefix -> contact lookups for incoming messages, valid for one
+# MeshCore instance and contact count, and never longer than the TTL
+_CONTACT_CACHE_TTL = 30.0
+_contact_cache = {'mc': None, 'count': None, 'expires': 0.0, 'map': {}}
+
+
+# Most names kept in each of the recent channel/user sets
+_RECENT_MAX_SIZE = 500
+
+
+class _RecentSet:
+    """Set of recently seen names, capped in size, kept in sorted order
 
+    Once full, adding a new name evicts the one seen least recently.
+    Not thread-safe: add() updates the LRU order and the sorted list in
+    separate steps, so only call it from the event-loop thread. Worker
+    threads collect names and hand them back (see load_all_history).
+    """
 
-# Global variables to store recent channels and users
-recent_channels = set()
-recent_users = set()
+    def __init__(self, max_size=_RECENT_MAX_SIZE):
+        self._max_size = max_size
+        self._items = collections.OrderedDict()
+        self._sorted = []
+
+    def add(self, item):
+        if item in self._items:
+            self._items.move_to_end(item)
+            return
+        self._items[item] = None
+        bisect.insort(self._sorted, item)
+        if len(self._items) > self._max_size:
+            evicted, _ = self._items.popitem(last=False)
+            del self._sorted[bisect.bisect_left(self._sorted, evicted)]
+
+    def sorted(self):
+        """Names in sorted order; the list is shared, don't modify it"""
+        return self._sorted
+
+    def __contains__(self, item):
+        return item in self._items
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __len__(self):
+        return len(self._items)
+
+
+# Global variables to store recent channels and users; event-loop thread only
+recent_channels = _RecentSet()
+recent_users = _RecentSet()
+
+
+@functools.lru_cache(maxsize=256)
+def _display_name(channel_name):
+    """Channel name as displayed, with a # prefix"""
+    return channel_name if channel_name.startswith('#') else f"#{channel_name}"
+
+
+def _now_timestamp():
+    """Current time in the history format, e.g. 17-Jan-26 22:46:29"""
+    now = int(time.time())
+    if now != _last_timestamp[0]:
+        _last_timestamp[0] = now
+        _last_timestamp[1] = datetime.datetime.fromtimestamp(now).strftime("%d-%b-%y %H:%M:%S")
+    return _last_timestamp[1]
 
 
 def parse_message_timestamp(message_line):
     """Parse timestamp from message line in various formats"""
-    import datetime as dt_module
+    # Lines without a leading bracket can't carry a timestamp
+    if not message_line.startswith('['):
+        return None
 
     # Match timestamp pattern: anything in brackets at the start
-    match = re.search(r'^\[([^\]]+)\]\s*(.*)', message_line)
+    match = _TS_BRACKET_RE.match(message_line)
     if match:
-        timestamp_str = match.group(1)
-
-        # Try different possible timestamp formats
-        possible_formats = [
-            "%d-%b-%y %H:%M:%S",  # Original format: 17-Jan-26 22:46:29
-            "%d-%B-%y %H:%M:%S",  # Full month name: 17-January-26 22:46:29
-            "%m/%d/%y %H:%M:%S",  # MM/DD/YY: 01/17/26 22:46:29
-            "%d/%m/%y %H:%M:%S",  # DD/MM/YY: 17/01/26 22:46:29
-            "%Y-%m-%d %H:%M:%S",  # YYYY-MM-DD: 2026-01-17 22:46:29
-            "%m-%d-%Y %H:%M:%S",  # MM-DD-YYYY: 01-17-2026 22:46:29
-        ]
-
-        for fmt in possible_formats:
-            try:
-                parsed_dt = dt_module.datetime.strptime(timestamp_str, fmt)
-                return parsed_dt
-            except ValueError:
-                continue
-
-        # Handle time-only format like "HH:MM:SS" or "HH:MM"
-        time_match = re.match(r'^(\d{1,2}):(\d{2})(?::(\d{2}))?$', timestamp_str)
-        if time_match:
-            hour = int(time_match.group(1))
-            minute = int(time_match.group(2))
-            second = int(time_match.group(3)) if time_match.group(3) else 0
-
-            # Since we only have time, use today's date as a fallback
-            # Or better yet, try to infer date from context
-            # For now, return a datetime with a default date (we'll use today)
-            today = dt_module.date.today()
-            return dt_module.datetime.combine(today, dt_module.time(hour, minute, second))
-
-        # Handle the original format with month abbreviations (DD-Mon-YY HH:MM:SS)
-        if '-' in timestamp_str and len(timestamp_str) >= 14:  # Minimum length for "DD-Mon-YY HH:MM:SS"
-            try:
-                parts = timestamp_str.split()
-                if len(parts) == 2:  # date and time parts
-                    date_part = parts[0]
-                    time_part = parts[1]
-                    if '-' in date_part:
-                        date_components = date_part.split('-')
-                        if len(date_components) == 3:
-                            day, month_abbr, year = date_components
-
-                            # Map month abbreviations to numbers
-                            month_map = {
-                                'Jan': '01', 'Feb': '02', 'Mar': '03', 'Apr': '04', 'May': '05', 'Jun': '06',
-                                'Jul': '07', 'Aug': '08', 'Sep': '09', 'Oct': '10', 'Nov': '11', 'Dec': '12'
-                            }
-
-                            month_num = month_map.get(month_abbr.capitalize())
-                            if month_num:
-                                # Handle 2-digit year
-                                if int(year) < 50:
-                                    year = "20" + year  # 26 -> 2026
-                                else:
-                                    year = "19" + year  # 45 -> 1945 (hypothetical)
-
-                                formatted_date = f"{year}-{month_num}-{day.zfill(2)}"
-                                formatted_datetime = f"{formatted_date} {time_part}"
-                                parsed_dt = dt_module.datetime.strptime(formatted_datetime, "%Y-%m-%d %H:%M:%S")
-                                return parsed_dt
-            except Exception:
-                pass
+        return _parse_bracket_timestamp(match.group(1))
 
     return None
 
 
-def load_history_from_file(channel_name):
-    """Load and display history from file for a specific channel"""
-    history_dir = Path("history")
-    log_file = history_dir / f"{channel_name}.log"
+def _parse_history_line(message_line):
+    """Parse a history line into _ParsedLine(timestamp, channel, user)
+
+    Returns None if the line has no parseable timestamp; channel and user are
+    None when the rest isn't in the "#channel: [user] text" form.
+    """
+    if not message_line.startswith('['):
+        return None
+
+    # Lines written by this client: one regex pass, no timestamp string round-trip
+    fast_match = _FAST_LINE_RE.match(message_line)
+    if fast_match:
+        day, month_abbr, year, hour, minute, second, channel, user = fast_match.groups()
+        timestamp = _fast_timestamp(day, month_abbr, year, hour, minute, second)
+        if timestamp is not None:
+            return _ParsedLine(timestamp, channel, user)
+
+    match = _TS_BRACKET_RE.match(message_line)
+    if not match:
+        return None
+    timestamp = _parse_bracket_timestamp(match.group(1))
+    if timestamp is None:
+        return None
+
+    # Only the text after the timestamp needs scanning for channel and user
+    chan_match = _CHAN_USER_RE.match(match.group(2))
+    if chan_match:
+        return _ParsedLine(timestamp, chan_match.group(1), chan_match.group(2))
+    return _ParsedLine(timestamp, None, None)
+
+
+def _parse_bracket_timestamp(timestamp_str):
+    """Parse the text between the leading brackets of a message line"""
+    parsed_dt = _parse_timestamp_str(timestamp_str)
+    if parsed_dt is not None:
+        return parsed_dt
+
+    # Handle time-only format like "HH:MM:SS" or "HH:MM"
+    time_match = _TIME_ONLY_RE.match(timestamp_str)
+    if time_match:
+        hour = int(time_match.group(1))
+        minute = int(time_match.group(2))
+        second = int(time_match.group(3)) if time_match.group(3) else 0
+
+        # Since we only have time, use today's date as a fallback
+        # Or better yet, try to infer date from context
+        # For now, return a datetime with a default date (we'll use today)
+        today = datetime.date.today()
+        return datetime.datetime.combine(today, datetime.time(hour, minute, second))
 
-    if not log_file.exists():
-        return []
+    return None
+
+
+def _fast_timestamp(day, month_abbr, year, hour, minute, second):
+    """Build the datetime for "17-Jan-26 22:46:29" fields, or None if they're invalid"""
+    month = _MONTH_NUM.get(month_abbr.capitalize())
+    if month:
+        # Same two-digit year pivot as strptime's %y
+        year = int(year)
+        year += 2000 if year < 69 else 1900
+        try:
+            return datetime.datetime(year, month, int(day), int(hour), int(minute), int(second))
+        except ValueError:
+            pass
+    return None
+
+
+@functools.lru_cache(maxsize=4096)
+def _parse_timestamp_str(timestamp_str):
+    """Parse a bracketed timestamp that carries a full date
+
+    Cached: messages from the same second share a timestamp string.
+    Time-only stamps depend on today's date and are handled by the caller.
+    """
+    # Fast path for the format written by this client
+    fast_match = _FAST_TS_RE.fullmatch(timestamp_str)
+    if fast_match:
+        parsed_dt = _fast_timestamp(*fast_match.groups())
+        if parsed_dt is not None:
+            return parsed_dt
+
+    # ISO 8601 timestamps are parsed by a C fast path
+    try:
+        parsed_dt = datetime.datetime.fromisoformat(timestamp_str)
+        if parsed_dt.tzinfo is not None:
+            # Naive local time, like every other format, so timestamps stay comparable
+            parsed_dt = parsed_dt.astimezone().replace(tzinfo=None)
+        return parsed_dt
+    except (ValueError, OverflowError):
+        pass
+
+    # Try different possible timestamp formats
+    for fmt in _TIMESTAMP_FORMATS:
+        try:
+            parsed_dt = datetime.datetime.strptime(timestamp_str, fmt)
+            return parsed_dt
+        except ValueError:
+            continue
+
+    # Handle the original format with month abbreviations (DD-Mon-YY HH:MM:SS)
+    if '-' in timestamp_str and len(timestamp_str) >= 14:  # Minimum length for "DD-Mon-YY HH:MM:SS"
+        try:
+            parts = timestamp_str.split()
+            if len(parts) == 2:  # date and time parts
+                date_part = parts[0]
+                time_part = parts[1]
+                if '-' in date_part:
+                    date_components = date_part.split('-')
+                    if len(date_components) == 3:
+                        day, month_abbr, year = date_components
+
+                        # Map month abbreviations to numbers
+                        month_map = {
+                            'Jan': '01', 'Feb': '02', 'Mar': '03', 'Apr': '04', 'May': '05', 'Jun': '06',
+                            'Jul': '07', 'Aug': '08', 'Sep': '09', 'Oct': '10', 'Nov': '11', 'Dec': '12'
+                        }
+
+                        month_num = month_map.get(month_abbr.capitalize())
+                        if month_num:
+                            # Handle 2-digit year
+                            if int(year) < 50:
+                                year = "20" + year  # 26 -> 2026
+                            else:
+                                year = "19" + year  # 45 -> 1945 (hypothetical)
+
+                            formatted_date = f"{year}-{month_num}-{day.zfill(2)}"
+                            formatted_datetime = f"{formatted_date} {time_part}"
+                            parsed_dt = datetime.datetime.strptime(formatted_datetime, "%Y-%m-%d %H:%M:%S")
+                            return parsed_dt
+        except Exception:
+            pass
+
+    return None
+
+
+def load_history_from_file(channel_name, max_lines=None):
+    """Load and display history from file for a specific channel
+
+    With max_lines, only the last max_lines messages are kept, so a long log
+    costs constant memory; by default all of them are returned.
+    """
+    log_file = HISTORY_DIR / f"{channel_name}.log"
+    flush_history()
 
     messages = []
     try:
         with open(log_file, "r", encoding="utf-8") as f:
-            for line in f:
-                line = line.strip()
-                if line:
-                    messages.append(line)
+            if max_lines is None:
+                # One read and a C-level split; universal newlines already turned
+                # \r\n into \n, so this matches iterating the file line by line
+                messages = [line for line in map(str.strip, f.read().split("\n")) if line]
+            else:
+                # Stream the file, keeping only the tail, without a Python-level loop
+                messages = list(collections.deque(filter(None, map(str.strip, f)), maxlen=max_lines))
+            if max_lines is None or len(messages) < max_lines:
+                # The whole file is at hand: seed the duplicate-check cache
+                _history_cache[str(log_file)] = (_file_signature(os.fstat(f.fileno())), set(map(_line_digest, messages)))
+    except FileNotFoundError:
+        # No history for this channel yet
+        pass
     except Exception as e:
         error_msg = f"Error reading history file {log_file}: {e}"
         print(error_msg)
@@ -122,57 +367,66 @@ def load_history_from_file(channel_name):
     return messages
 
 
-def load_all_history(append_output_callback=None):
-    """Load and display history from all channel files in chronological order"""
-    history_dir = Path("history")
-    if not history_dir.exists():
-        return
+def _iter_timestamped_messages(log_file):
+    """Yield (_ParsedLine, message) for every line of a history file with a parseable timestamp"""
+    try:
+        with open(log_file, "r", encoding="utf-8", buffering=_READ_BUFFER_SIZE) as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    parsed = _parse_history_line(line)
+                    if parsed:
+                        yield parsed, line
+    except Exception as e:
+        print(f"Error reading history file {log_file}: {e}")
 
-    # Get all log files
-    log_files = list(history_dir.glob("*.log"))
 
-    # Collect all messages with their parsed timestamps
-    all_messages = []
-    for log_file in log_files:
-        channel_name = log_file.stem  # Get channel name from filename
-        messages = load_history_from_file(channel_name)
+def load_all_history(append_output_callback=None, names_callback=None):
+    """Load and display history from all channel files in chronological order
+
+    Channel and user names found in the history are passed to
+    names_callback(channel, user), by default add_recent_names. Callers
+    running off the event-loop thread collect them instead and add them
+    from the loop.
+    """
+    if names_callback is None:
+        names_callback = add_recent_names
+    flush_history()
 
-        for msg in messages:
-            timestamp = parse_message_timestamp(msg)
-            if timestamp:
-                all_messages.append((timestamp, msg))
+    # Get all log files
+    log_files = [entry.path for entry in _scan_history_logs()]
 
-    # Sort messages by timestamp
-    all_messages.sort(key=lambda x: x[0])
+    # Each log is appended in arrival order and so is already chronological;
+    # a k-way merge of the per-file streams yields the global order without
+    # holding every message in memory or sorting them all
+    all_messages = heapq.merge(*(_iter_timestamped_messages(log_file) for log_file in log_files),
+                               key=lambda x: x[0].timestamp)
 
     # Display messages in chronological order
-    for _, msg in all_messages:
+    for parsed, msg in all_messages:
         if append_output_callback:
             append_output_callback(msg)
         else:
             print(msg)
 
-        # Extract channel and user information from the message for autocompletion
-        # Format: [timestamp] #channel: [user] text
-        import re
-        match = re.match(r'^\[.+\] #([^:]+):\s*\[([^\]]+)\].*', msg)
-        if match:
-            channel_name = match.group(1)
-            user_name = match.group(2)
+        # Channel and user information for autocompletion, taken from
+        # "[timestamp] #channel: [user] text" lines while parsing
+        if parsed.channel is not None:
+            names_callback(parsed.channel, parsed.user)
 
-            # Add to global sets
-            recent_channels.add(channel_name)
-            recent_users.add(user_name)
 
-            # Add channel with # prefix as well for autocomplete
-            channel_with_prefix = f"#{channel_name}" if not channel_name.startswith('#') else channel_name
-            recent_channels.add(channel_with_prefix)
+def add_recent_names(channel_name, user_name):
+    """Remember a channel and user seen in a message for autocompletion"""
+    recent_channels.add(channel_name)
+    recent_users.add(user_name)
+
+    # Add channel with # prefix as well for autocomplete
+    recent_channels.add(_display_name(channel_name))
 
 
 def process_event_message(mc, ev, append_output_callback=None):
     """Process incoming message events and format output"""
     global recent_channels, recent_users  # noqa: F824 - variables are modified with .add() method
-    from meshcore import EventType
 
     if ev is None:
         message = "Event does not contain message."
@@ -196,7 +450,8 @@ def process_event_message(mc, ev, append_output_callback=None):
         return False
     else:
         data = ev.payload
-        log_debug(f"INCOMING EVENT: Processing event of type {ev.type}, data: {data}")
+        if _DEBUG_ENABLED:
+            log_debug(f"INCOMING EVENT: Processing event of type {ev.type}, data: {data}")
 
         # Determine channel and user information
         if data['type'] == "CHAN":  # Channel message
@@ -215,7 +470,7 @@ def process_event_message(mc, ev, append_output_callback=None):
             recent_channels.add(channel_name)
 
             # Get sender information - prioritize name field if available, then fall back to contact lookup
-            sender = "Unknown"
+            sender = None  # Not resolved yet
             # First try to use the name field directly if available
             if 'name' in data and data['name']:
                 sender = data['name']
@@ -223,7 +478,7 @@ def process_event_message(mc, ev, append_output_callback=None):
                 recent_users.add(data['name'])
             # Then try to look up by pubkey_prefix
             elif 'pubkey_prefix' in data:
-                ct = mc.get_contact_by_key_prefix(data['pubkey_prefix'])
+                ct = _lookup_contact(mc, data['pubkey_prefix'])
                 if ct is None:
                     sender = data["pubkey_prefix"][:12]  # Shortened key
                 else:
@@ -236,22 +491,23 @@ def process_event_message(mc, ev, append_output_callback=None):
                     recent_users.add(data['name'])
 
             # Format timestamp
-            timestamp = datetime.datetime.now().strftime("%d-%b-%y %H:%M:%S")
+            timestamp = _now_timestamp()
 
             # Extract sender from text if it follows "Name: message" format
             text = data['text']
-            if ': ' in text and sender == "Unknown":
+            if sender is None and ': ' in text:
                 # Try to extract sender name from the beginning of the text
-                potential_sender, potential_text = text.split(': ', 1)
-                # Check if this looks like a valid sender name (not too long, contains common name chars)
-                if len(potential_sender) <= 30 and any(c.isalnum() or c in '@._-' for c in potential_sender):
-                    sender = potential_sender
-                    text = potential_text
+                sender_match = _SENDER_RE.match(text)
+                # Check if this looks like a valid sender name (contains common name chars)
+                if sender_match and _VALID_SENDER_RE.search(sender_match.group(1)):
+                    sender, text = sender_match.groups()
                     # Add to recent users
                     recent_users.add(sender)
+            if sender is None:
+                sender = "Unknown"
 
             # Format channel name for display - add # prefix if it doesn't already have one
-            display_channel_name = channel_name if channel_name.startswith('#') else f"#{channel_name}"
+            display_channel_name = _display_name(channel_name)
 
             # Format message
             message = f"[{timestamp}] {display_channel_name}: [{sender}] {text}"
@@ -270,10 +526,11 @@ def process_event_message(mc, ev, append_output_callback=None):
                 print(colored_message)
 
             # Log the incoming message
-            log_debug(f"INCOMING MESSAGE: channel={display_channel_name}, sender={sender}, text='{text}', timestamp={timestamp}")
+            if _DEBUG_ENABLED:
+                log_debug(f"INCOMING MESSAGE: channel={display_channel_name}, sender={sender}, text='{text}', timestamp={timestamp}")
 
             # Save to history file
-            save_to_history(channel_name, message)
+            save_to_history(channel_name, message, check_duplicates=False)
 
         elif data['type'] == "PRIV":  # Private message
             # Get sender information - prioritize name field if available, then fall back to contact lookup
@@ -285,7 +542,7 @@ def process_event_message(mc, ev, append_output_callback=None):
                 recent_users.add(sender)
             # Then try to look up by pubkey_prefix
             elif 'pubkey_prefix' in data:
-                ct = mc.get_contact_by_key_prefix(data['pubkey_prefix'])
+                ct = _lookup_contact(mc, data['pubkey_prefix'])
                 if ct is None:
                     sender = data["pubkey_prefix"][:12]  # Shortened key
                 else:
@@ -294,7 +551,7 @@ def process_event_message(mc, ev, append_output_callback=None):
                     recent_users.add(sender)
 
             # Format timestamp
-            timestamp = datetime.datetime.now().strftime("%d-%b-%y %H:%M:%S")
+            timestamp = _now_timestamp()
 
             # Format message
             message = f"[{timestamp}] #private: [{sender}] {data['text']}"
@@ -313,77 +570,300 @@ def process_event_message(mc, ev, append_output_callback=None):
                 print(colored_message)
 
             # Log the incoming private message
-            log_debug(f"INCOMING PRIVATE MESSAGE: sender={sender}, text='{data['text']}', timestamp={timestamp}")
+            if _DEBUG_ENABLED:
+                log_debug(f"INCOMING PRIVATE MESSAGE: sender={sender}, text='{data['text']}', timestamp={timestamp}")
 
             # Save to history file
-            save_to_history("private", message)
+            save_to_history("private", message, check_duplicates=False)
 
         return True
 
 
-def save_to_history(channel_name, message):
-    """Save message to history file, avoiding duplicates"""
+def _lookup_contact(mc, prefix):
+    """mc.get_contact_by_key_prefix, cached while the contact list doesn't change"""
+    try:
+        count = len(mc.contacts)
+    except TypeError:
+        count = None
+
+    now = time.monotonic()
+    cache = _contact_cache
+    if cache['mc'] is not mc or cache['count'] != count or now >= cache['expires']:
+        cache.update(mc=mc, count=count, expires=now + _CONTACT_CACHE_TTL, map={})
+
+    contacts = cache['map']
+    try:
+        return contacts[prefix]
+    except KeyError:
+        # Misses (None) are cached too; a new contact changes the count
+        ct = contacts[prefix] = mc.get_contact_by_key_prefix(prefix)
+        return ct
+
+
+def save_to_history(channel_name, message, check_duplicates=True):
+    """Save message to history file, avoiding duplicates
+
+    Messages just received from the radio carry the current time and can't
+    already be in the file, so that path passes check_duplicates=False to
+    append without reading the file first.
+
+    Inside a running event loop the line is buffered and written out by
+    flush_history() shortly after, together with any others saved meanwhile.
+    """
     # Create history directory if it doesn't exist
-    history_dir = Path("history")
-    history_dir.mkdir(exist_ok=True)
+    _ensure_history_dir()
 
     # Create log file path
-    log_file = history_dir / f"{channel_name}.log"
-
-    # Read existing messages to check for duplicates
-    existing_messages = set()
-    if log_file.exists():
-        try:
-            with open(log_file, "r", encoding="utf-8") as f:
-                for line in f:
-                    line = line.strip()
-                    if line:
-                        existing_messages.add(line)
-        except Exception as e:
-            print(f"Error reading history file {log_file} for duplicate check: {e}")
+    log_file = HISTORY_DIR / f"{channel_name}.log"
+    cache_key = str(log_file)
+
+    digest = _line_digest(message)
+    f = _pending_history_writes.get(cache_key)
+    cached = _history_cache.get(cache_key)
+    if f is not None and (cached is not None or not check_duplicates):
+        # Written moments ago with lines still buffered: the open handle and
+        # the cached set, if any, are current
+        signature, existing_messages = cached if cached is not None else (None, None)
+        if check_duplicates and digest in existing_messages:
+            return
+    else:
+        if f is not None:
+            # Nothing cached to check against; write out the buffered lines first
+            _flush_history_file(cache_key)
+
+        if check_duplicates:
+            # Existing messages to check for duplicates
+            signature, existing_messages = _get_saved_messages(log_file)
+            if digest in existing_messages:
+                return
+        else:
+            # Keep the cached set in step only if it's already current
+            signature = _stat_signature(log_file)
+            existing_messages = cached[1] if cached is not None and cached[0] == signature else None
 
-    # Only save if message is not a duplicate
-    if message not in existing_messages:
         try:
-            with open(log_file, "a", encoding="utf-8") as f:
-                f.write(message + "\n")
+            f = _get_history_file(log_file, signature)
         except Exception as e:
             print(f"Error writing to history file {log_file}: {e}")
+            return
 
+    try:
+        f.write(message + "\n")
+    except Exception as e:
+        print(f"Error writing to history file {log_file}: {e}")
+        return
 
-def remove_duplicate_messages(channel_name):
-    """Remove duplicate messages from a history file"""
-    history_dir = Path("history")
-    log_file = history_dir / f"{channel_name}.log"
+    if existing_messages is not None:
+        existing_messages.add(digest)
+        # The signature is brought up to date when the line is flushed
+        _history_cache[cache_key] = (signature, existing_messages)
+    else:
+        _history_cache.pop(cache_key, None)
+    _schedule_history_flush(cache_key, f)
 
-    if not log_file.exists():
+
+def _schedule_history_flush(cache_key, f):
+    """Queue a written history file for the next flush_history()"""
+    global _history_flush_handle, _history_flush_loop
+    _pending_history_writes[cache_key] = f
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        # No event loop to flush from later (scripts, tests): write through
+        flush_history()
         return
+    if _history_flush_handle is not None:
+        if _history_flush_loop is loop:
+            return
+        # Scheduled on a loop that has since finished; it will never fire
+        _history_flush_handle.cancel()
+    _history_flush_handle = loop.call_later(_HISTORY_FLUSH_DELAY, flush_history)
+    _history_flush_loop = loop
+
+
+def flush_history():
+    """Write out history lines still buffered by save_to_history"""
+    global _history_flush_handle, _history_flush_loop
+    if _history_flush_handle is not None:
+        _history_flush_handle.cancel()
+        _history_flush_handle = None
+        _history_flush_loop = None
+    for cache_key in list(_pending_history_writes):
+        _flush_history_file(cache_key)
+
+
+def _flush_history_file(cache_key):
+    """Flush one history file's pending lines and refresh its cached signature"""
+    f = _pending_history_writes.pop(cache_key, None)
+    if f is None:
+        return
+    try:
+        f.flush()
+        cached = _history_cache.get(cache_key)
+        if cached is not None:
+            _history_cache[cache_key] = (_file_signature(os.fstat(f.fileno())), cached[1])
+    except Exception as e:
+        print(f"Error writing to history file {cache_key}: {e}")
+        _history_cache.pop(cache_key, None)
+
+
+def _get_history_file(log_file, signature):
+    """Return the pooled append handle for a history file, reopening it if the file was replaced"""
+    cache_key = str(log_file)
+    entry = _history_files.get(cache_key)
+    if entry is not None:
+        f, identity = entry
+        # signature is None when the file no longer exists at its path
+        if signature is not None and identity == signature[:2]:
+            return f
+        f.close()
+
+    f = open(log_file, "a", encoding="utf-8", buffering=_WRITE_BUFFER_SIZE)
+    st = os.fstat(f.fileno())
+    _history_files[cache_key] = (f, (st.st_dev, st.st_ino))
+    return f
+
+
+def _close_history_files():
+    """Close all pooled history file handles"""
+    # Closing flushes whatever is still buffered
+    _pending_history_writes.clear()
+    for f, _ in _history_files.values():
+        try:
+            f.close()
+        except OSError:
+            pass
+    _history_files.clear()
 
-    # Read all messages
-    messages = []
-    seen_messages = set()
-    duplicates_removed = 0
 
+atexit.register(_close_history_files)
+
+
+def _ensure_history_dir():
+    """Create the history directory on first use"""
+    global _history_dir_ready
+    if _history_dir_ready is not HISTORY_DIR:
+        HISTORY_DIR.mkdir(exist_ok=True)
+        _history_dir_ready = HISTORY_DIR
+
+
+def _file_signature(st):
+    """Identity, size and modification time of a file, from its stat result"""
+    return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+def _line_digest(line):
+    """Compact stand-in for a history line in duplicate checks
+
+    16 bytes instead of the whole line; at 128 bits a collision, which would
+    drop a genuinely new message, is not a practical concern.
+    """
+    return hashlib.blake2b(line.encode('utf-8'), digest_size=16).digest()
+
+
+def _stat_signature(path):
+    """Signature of the file at path, or None if it doesn't exist"""
     try:
-        with open(log_file, "r", encoding="utf-8") as f:
+        return _file_signature(os.stat(path))
+    except OSError:
+        return None
+
+
+def _get_saved_messages(log_file):
+    """Return the (signature, set of messages) of a history file, reading it only if it changed
+
+    The signature is None when the file doesn't exist.
+    """
+    cache_key = str(log_file)
+    signature = _stat_signature(log_file)
+    if signature is None:
+        # No file yet, nothing saved
+        _history_cache.pop(cache_key, None)
+        return None, set()
+
+    cached = _history_cache.get(cache_key)
+    if cached is not None and cached[0] == signature:
+        return cached
+
+    existing_messages = set()
+    try:
+        with open(log_file, "r", encoding="utf-8", buffering=_READ_BUFFER_SIZE) as f:
             for line in f:
                 line = line.strip()
-                if line and line not in seen_messages:
-                    messages.append(line)
-                    seen_messages.add(line)
-                elif line:  # It's a duplicate
+                if line:
+                    existing_messages.add(_line_digest(line))
+    except Exception as e:
+        print(f"Error reading history file {log_file} for duplicate check: {e}")
+        return signature, existing_messages
+
+    _history_cache[cache_key] = (signature, existing_messages)
+    return signature, existing_messages
+
+
+def remove_duplicate_messages(channel_name):
+    """Remove duplicate messages from a history file"""
+    log_file = HISTORY_DIR / f"{channel_name}.log"
+    flush_history()
+
+    # Stream unique lines into a temp file next to the log, remembering only
+    # line digests
+    seen_hashes = set()
+    duplicates_removed = 0
+    # Whether the file differs from what we write (blank or padded lines)
+    needs_cleanup = False
+    tmp = None
+
+    try:
+        with open(log_file, "r", encoding="utf-8", buffering=_READ_BUFFER_SIZE) as f, \
+                tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=HISTORY_DIR,
+                                            suffix=".tmp", delete=False) as tmp:
+            for raw_line in f:
+                line = raw_line.strip()
+                if len(line) + 1 != len(raw_line):
+                    needs_cleanup = True
+                if not line:
+                    continue
+                line_hash = _line_digest(line)
+                if line_hash in seen_hashes:
                     duplicates_removed += 1
+                else:
+                    seen_hashes.add(line_hash)
+                    tmp.write(line + "\n")
+    except FileNotFoundError:
+        # Nothing to deduplicate
+        return
     except Exception as e:
-        print(f"Error reading history file {log_file} for duplicate removal: {e}")
+        print(f"Error deduplicating history file {log_file}: {e}")
+        if tmp is not None:
+            try:
+                os.unlink(tmp.name)
+            except OSError:
+                pass
         return
 
-    # Write unique messages back to file
+    if not duplicates_removed and not needs_cleanup:
+        # Already clean; leave the file (and its mtime) alone
+        try:
+            os.unlink(tmp.name)
+        except OSError:
+            pass
+        return
+
+    # Release the pooled append handle before swapping the file in
+    entry = _history_files.pop(str(log_file), None)
+    if entry is not None:
+        entry[0].close()
+
     try:
-        with open(log_file, "w", encoding="utf-8") as f:
-            for msg in messages:
-                f.write(msg + "\n")
+        # Temp files are created owner-only; keep the log's own permissions
+        shutil.copymode(log_file, tmp.name)
+        os.replace(tmp.name, log_file)
     except Exception as e:
         print(f"Error writing deduplicated messages to {log_file}: {e}")
+        try:
+            os.unlink(tmp.name)
+        except OSError:
+            pass
 
     if duplicates_removed > 0:
         print(f"Removed {duplicates_removed} duplicate messages from {channel_name}.log")
@@ -391,23 +871,44 @@ def remove_duplicate_messages(channel_name):
 
 def clean_history_files():
     """Clean all history files by removing duplicates"""
-    history_dir = Path("history")
-    if not history_dir.exists():
-        return
+    for entry in _scan_history_logs():
+        channel_name = entry.name[:-4]  # Get channel name from filename
+        remove_duplicate_messages(channel_name)
 
-    # Get all log files
-    log_files = list(history_dir.glob("*.log"))
 
-    for log_file in log_files:
-        channel_name = log_file.stem  # Get channel name from filename
-        remove_duplicate_messages(channel_name)
+def _scan_history_logs():
+    """Return the directory entries of all .log files in the history directory"""
+    try:
+        with os.scandir(HISTORY_DIR) as entries:
+            # DirEntry caches the file type from the directory listing, so
+            # is_file() costs no extra stat on most platforms
+            return [entry for entry in entries if entry.name.endswith('.log') and entry.is_file()]
+    except FileNotFoundError:
+        # No history directory yet
+        return []
+
+
+def _get_channel_index(channels):
+    """Return a {name: index} lookup for the channel list, rebuilt only when the list changes"""
+    if _channel_index_cache['channels'] is not channels or _channel_index_cache['size'] != len(channels):
+        index = {}
+        for idx, channel in enumerate(channels):
+            name = channel['channel_name']
+            # Accept the exact name, the name with a # prefix and, for names that
+            # have one, the name without it. The first channel to claim a
+            # spelling keeps it, as the first match of a linear scan would.
+            index.setdefault(name, idx)
+            index.setdefault(f"#{name}", idx)
+            if name and name.startswith('#'):
+                index.setdefault(name[1:], idx)
+        _channel_index_cache['channels'] = channels
+        _channel_index_cache['size'] = len(channels)
+        _channel_index_cache['map'] = index
+    return _channel_index_cache['map']
 
 
 async def send_message(mc, target, text, append_output_callback=None, app_instance=None, timeout=60):
     """Send a message to a channel or contact (private message)"""
-    # Import here to avoid circular imports
-    from meshcore import EventType
-
     # Determine if this is a channel message or private message
     is_channel_msg = not target.startswith('@')
     target_name = target[1:] if target.startswith('@') else target
@@ -416,17 +917,7 @@ async def send_message(mc, target, text, append_output_callback=None, app_instan
         # Find channel by name
         channel_idx = None
         if hasattr(mc, "channels") and mc.channels:
-            for idx, channel in enumerate(mc.channels):
-                # Check exact match or match with # prefix
-                if channel['channel_name'] == target_name or f"#{channel['channel_name']}" == target_name:
-                    channel_idx = idx
-                    break
-                # Also check if channel name matches without the # prefix
-                elif (channel['channel_name'] and
-                      channel['channel_name'].startswith('#') and
-                      channel['channel_name'][1:] == target_name):
-                    channel_idx = idx
-                    break
+            channel_idx = _get_channel_index(mc.channels).get(target_name)
 
         # If not found by name, check if it's a channel index
         if channel_idx is None and target_name.startswith("ch") and target_name[2:].isdigit():
@@ -472,14 +963,14 @@ async def send_message(mc, target, text, append_output_callback=None, app_instan
             return False
 
     # Format timestamp
-    timestamp = datetime.datetime.now().strftime("%d-%b-%y %H:%M:%S")
+    timestamp = _now_timestamp()
 
     # Get own name from device info
     own_name = mc.self_info.get('name', 'Me')
 
     if is_channel_msg:
         # Format channel name for display - add # prefix if it doesn't already have one
-        display_channel_name = target_name if target_name.startswith('#') else f"#{target_name}"
+        display_channel_name = _display_name(target_name)
 
         # Format message for display (without status indicators initially)
         display_message = (
@@ -496,8 +987,7 @@ async def send_message(mc, target, text, append_output_callback=None, app_instan
         log_debug(f"OUTGOING MESSAGE: channel={target_name}, text='{text}', timestamp={timestamp}")
 
         # Save to history file with # symbol in the filename
-        actual_channel_name = display_channel_name if display_channel_name.startswith('#') else f"#{target_name}"
-        save_to_history(actual_channel_name, f"[{timestamp}] {display_channel_name}: [{own_name}] {text}")
+        save_to_history(display_channel_name, display_message)
     else:
         # Format private message for display
         display_message = (
@@ -514,7 +1004,7 @@ async def send_message(mc, target, text, append_output_callback=None, app_instan
         log_debug(f"OUTGOING PRIVATE MESSAGE: contact={target_name}, text='{text}', timestamp={timestamp}")
 
         # Save to private history file
-        save_to_history("private", f"[{timestamp}] #private: [{own_name}] {text}")
+        save_to_history("private", display_message)
 
 
 
@@ -561,20 +1051,13 @@ async def send_message(mc, target, text, append_output_callback=None, app_instan
 
 
     except Exception as e:
-        # Error status
+        # Error status; display_message is still the line built above
         if is_channel_msg:
-            display_message = (
-                f"[{timestamp}] {display_channel_name}: [{own_name}] {text}"
-            )
             # Save to history file with # symbol in the filename
-            actual_channel_name = display_channel_name if display_channel_name.startswith('#') else f"#{target_name}"
-            save_to_history(actual_channel_name, f"[{timestamp}] {display_channel_name}: [{own_name}] {text}")
+            save_to_history(display_channel_name, display_message)
         else:
-            display_message = (
-                f"[{timestamp}] #private: [{own_name}] {text}"
-            )
             # Save to private history file
-            save_to_history("private", f"[{timestamp}] #private: [{own_name}] {text}")
+            save_to_history("private", display_message)
 
         if append_output_callback:
             append_output_callback(display_message)
@@ -601,8 +1084,8 @@ async def send_message(mc, target, text, append_output_callback=None, app_instan
 
 def show_available_channels_and_users(append_output_callback=None):
     """Show available channels and users"""
-    channels_msg = f"{ANSI_BCYAN}Available channels: {sorted(list(recent_channels))}{ANSI_END}"
-    users_msg = f"{ANSI_BCYAN}Recent users: {sorted(list(recent_users))}{ANSI_END}"
+    channels_msg = f"{ANSI_BCYAN}Available channels: {recent_channels.sorted()}{ANSI_END}"
+    users_msg = f"{ANSI_BCYAN}Recent users: {recent_users.sorted()}{ANSI_END}"
 
     if append_output_callback:
         append_output_callback(channels_msg)
@@ -1,14 +1,21 @@
+import asyncio
 import unittest
 import tempfile
-import os
 from pathlib import Path
-from unittest.mock import Mock, patch
+from unittest.mock import AsyncMock, Mock, patch
+from meshcore import EventType
 from mesh.messages import (
     parse_message_timestamp,
     load_history_from_file,
+    load_all_history,
     process_event_message,
     save_to_history,
-    remove_duplicate_messages
+    flush_history,
+    remove_duplicate_messages,
+    send_message,
+    _RecentSet,
+    _lookup_contact,
+    _parse_history_line
 )
 from mesh.config import get_config_path, load_config, save_config
 from mesh.constants import (
@@ -18,6 +25,16 @@ from mesh.constants import (
 )
 
 
+def _make_mc():
+    """Mock MeshCore connection with one channel and one known contact"""
+    mc = Mock()
+    mc.channels = [{'channel_name': 'test_channel'}]
+    mc.self_info = {'name': 'test_user'}
+    # A plain callable, not a Mock method, so lookups don't record calls
+    mc.get_contact_by_key_prefix = lambda prefix: {"adv_name": "test_contact"}
+    return mc
+
+
 class TestConstants(unittest.TestCase):
     """Test constants module"""
 
@@ -49,6 +66,10 @@ class TestMessages(unittest.TestCase):
         self.temp_dir = tempfile.mkdtemp()
         self.history_dir = Path(self.temp_dir) / "history"
         self.history_dir.mkdir(exist_ok=True)
+        # Point the history functions at the temporary directory
+        history_patcher = patch('mesh.messages.HISTORY_DIR', self.history_dir)
+        history_patcher.start()
+        self.addCleanup(history_patcher.stop)
 
     def tearDown(self):
         """Clean up test fixtures"""
@@ -83,91 +104,146 @@ class TestMessages(unittest.TestCase):
         timestamp = parse_message_timestamp(message)
         self.assertIsNone(timestamp)
 
+    def test_parse_history_line(self):
+        """Test splitting a history line into timestamp, channel and user"""
+        parsed = _parse_history_line("[17-Jan-26 22:46:29] #general: [user1] Hello: world")
+        self.assertEqual(parsed.timestamp.day, 17)
+        self.assertEqual(parsed.channel, "general")
+        self.assertEqual(parsed.user, "user1")
+
+        # Timestamped line without channel and user
+        parsed = _parse_history_line("[17-Jan-26 22:46:29] Some text")
+        self.assertIsNone(parsed.channel)
+        self.assertIsNone(parsed.user)
+
+        self.assertIsNone(_parse_history_line("No timestamp here"))
+        self.assertIsNone(_parse_history_line("[31-Feb-26 22:46:29] #general: [user1] Bad date"))
+
     def test_save_to_history_and_load(self):
         """Test saving and loading history"""
         channel_name = "test_channel"
         message = "[17-Jan-26 22:46:29] #test_channel: [user] Test message"
 
-        # Change history directory temporarily
-        original_history_dir = Path("history")
-        original_history_dir.rename(self.temp_dir + "/original_history") if original_history_dir.exists() else None
-        os.rename(str(self.history_dir), "history")
+        save_to_history(channel_name, message)
+
+        loaded_messages = load_history_from_file(channel_name)
+        self.assertEqual(len(loaded_messages), 1)
+        self.assertEqual(loaded_messages[0], message)
+
+    def test_load_all_history_mixes_aware_and_naive_timestamps(self):
+        """Test that logs with UTC-offset and plain timestamps merge without errors"""
+        iso_message = "[2026-01-10T22:46:29+00:00] #iso_channel: [user] Old message"
+        plain_message = "[17-Jan-26 22:46:29] #plain_channel: [user] New message"
+        (self.history_dir / "iso_channel.log").write_text(iso_message + "\n", encoding="utf-8")
+        (self.history_dir / "plain_channel.log").write_text(plain_message + "\n", encoding="utf-8")
+
+        lines = []
+        load_all_history(lines.append)
+
+        self.assertEqual(lines, [iso_message, plain_message])
+        self.assertIsNone(parse_message_timestamp(iso_message).tzinfo)
+
+    def test_save_after_event_loop_ends_is_written(self):
+        """Test that a flush scheduled on a finished event loop doesn't hold back later saves"""
+        first = "[17-Jan-26 22:46:29] #test_channel: [user] Inside the loop"
+        second = "[17-Jan-26 22:46:30] #test_channel: [user] After the loop"
+
+        async def save_in_loop():
+            save_to_history("test_channel", first, check_duplicates=False)
+
+        # The loop closes before its scheduled flush fires
+        asyncio.run(save_in_loop())
+        save_to_history("test_channel", second, check_duplicates=False)
+
+        log_file = self.history_dir / "test_channel.log"
+        self.assertEqual(log_file.read_text(encoding="utf-8"), f"{first}\n{second}\n")
+
+    def test_save_to_history_creates_history_dir(self):
+        """Test that saving creates the configured history directory"""
+        history_dir = self.history_dir / "nested"
+        message = "[17-Jan-26 22:46:29] #test_channel: [user] Test message"
 
-        try:
-            save_to_history(channel_name, message)
+        with patch('mesh.messages.HISTORY_DIR', history_dir):
+            save_to_history("test_channel", message)
 
-            loaded_messages = load_history_from_file(channel_name)
-            self.assertEqual(len(loaded_messages), 1)
-            self.assertEqual(loaded_messages[0], message)
-        finally:
-            # Restore original history directory
-            Path("history").rename(self.temp_dir + "/history_after_test")
-            original_hist_path = Path(self.temp_dir + "/original_history")
-            if original_hist_path.exists():
-                original_hist_path.rename(original_history_dir)
+        self.assertTrue((history_dir / "test_channel.log").exists())
+
+    def test_load_history_from_file_keeps_tail(self):
+        """Test that only the last max_lines messages are loaded"""
+        channel_name = "test_channel"
+        messages = [f"[17-Jan-26 22:46:{i:02d}] #test_channel: [user] Message {i}" for i in range(5)]
+
+        log_file = self.history_dir / f"{channel_name}.log"
+        log_file.write_text("\n".join(messages) + "\n\n", encoding="utf-8")
+
+        self.assertEqual(load_history_from_file(channel_name, max_lines=2), messages[3:])
+        self.assertEqual(load_history_from_file(channel_name), messages)
 
     def test_save_to_history_no_duplicates(self):
         """Test that duplicates are not saved"""
         channel_name = "test_channel"
         message = "[17-Jan-26 22:46:29] #test_channel: [user] Test message"
 
-        # Change history directory temporarily
-        original_history_dir = Path("history")
-        original_history_dir.rename(self.temp_dir + "/original_history") if original_history_dir.exists() else None
-        os.rename(str(self.history_dir), "history")
-
-        try:
-            # Save the same message twice
-            save_to_history(channel_name, message)
-            save_to_history(channel_name, message)
-
-            loaded_messages = load_history_from_file(channel_name)
-            self.assertEqual(len(loaded_messages), 1)  # Should only have one copy
-            self.assertEqual(loaded_messages[0], message)
-        finally:
-            # Restore original history directory
-            Path("history").rename(self.temp_dir + "/history_after_test")
-            original_hist_path = Path(self.temp_dir + "/original_history")
-            if original_hist_path.exists():
-                original_hist_path.rename(original_history_dir)
+        # Save the same message twice
+        save_to_history(channel_name, message)
+        save_to_history(channel_name, message)
+
+        loaded_messages = load_history_from_file(channel_name)
+        self.assertEqual(len(loaded_messages), 1)  # Should only have one copy
+        self.assertEqual(loaded_messages[0], message)
+
+    def test_save_to_history_without_duplicate_check(self):
+        """Test that check_duplicates=False appends without reading the file"""
+        channel_name = "test_channel"
+        message = "[17-Jan-26 22:46:29] #test_channel: [user] Test message"
+
+        save_to_history(channel_name, message)
+        save_to_history(channel_name, message, check_duplicates=False)
+        # The checked path still sees both copies already on disk
+        save_to_history(channel_name, message)
+
+        loaded_messages = load_history_from_file(channel_name)
+        self.assertEqual(loaded_messages, [message, message])
 
     def test_remove_duplicate_messages(self):
         """Test removing duplicate messages from a file"""
-        # Change history directory temporarily
-        original_history_dir = Path("history")
-        original_history_dir.rename(self.temp_dir + "/original_history") if original_history_dir.exists() else None
-        os.rename(str(self.history_dir), "history")
-
-        try:
-            channel_name = "duplicate_test"
-            message1 = "[17-Jan-26 22:46:29] #duplicate_test: [user1] First message"
-            message2 = "[17-Jan-26 22:47:30] #duplicate_test: [user2] Second message"
-
-            # Create a file with duplicates
-            log_file = Path("history") / f"{channel_name}.log"
-            with open(log_file, "w", encoding="utf-8") as f:
-                f.write(message1 + "\n")
-                f.write(message2 + "\n")
-                f.write(message1 + "\n")  # Duplicate
-                f.write(message2 + "\n")  # Duplicate
-
-            # Remove duplicates
-            remove_duplicate_messages(channel_name)
-
-            # Check the result
-            with open(log_file, "r", encoding="utf-8") as f:
-                lines = [line.strip() for line in f if line.strip()]
-
-            # Should have 2 unique messages
-            self.assertEqual(len(lines), 2)
-            self.assertIn(message1, lines)
-            self.assertIn(message2, lines)
-        finally:
-            # Restore original history directory
-            Path("history").rename(self.temp_dir + "/history_after_test")
-            original_hist_path = Path(self.temp_dir + "/original_history")
-            if original_hist_path.exists():
-                original_hist_path.rename(original_history_dir)
+        channel_name = "duplicate_test"
+        message1 = "[17-Jan-26 22:46:29] #duplicate_test: [user1] First message"
+        message2 = "[17-Jan-26 22:47:30] #duplicate_test: [user2] Second message"
+
+        # Create a file with duplicates
+        log_file = self.history_dir / f"{channel_name}.log"
+        with open(log_file, "w", encoding="utf-8") as f:
+            f.write(message1 + "\n")
+            f.write(message2 + "\n")
+            f.write(message1 + "\n")  # Duplicate
+            f.write(message2 + "\n")  # Duplicate
+
+        # Remove duplicates
+        remove_duplicate_messages(channel_name)
+
+        # Check the result
+        with open(log_file, "r", encoding="utf-8") as f:
+            lines = [line.strip() for line in f if line.strip()]
+
+        # Should have 2 unique messages
+        self.assertEqual(len(lines), 2)
+        self.assertIn(message1, lines)
+        self.assertIn(message2, lines)
+
+    def test_recent_set_sorted_and_capped(self):
+        """Test that recent names are listed sorted and the oldest is evicted"""
+        recent = _RecentSet(max_size=3)
+        for name in ("carol", "alice", "bob"):
+            recent.add(name)
+        self.assertEqual(recent.sorted(), ["alice", "bob", "carol"])
+
+        # Seeing "carol" again makes "alice" the least recent one
+        recent.add("carol")
+        recent.add("dave")
+        self.assertNotIn("alice", recent)
+        self.assertEqual(len(recent), 3)
+        self.assertEqual(recent.sorted(), ["bob", "carol", "dave"])
 
 
 class TestConfig(unittest.TestCase):
@@ -178,10 +254,13 @@ class TestConfig(unittest.TestCase):
         self.temp_dir = tempfile.mkdtemp()
         self.config_dir = Path(self.temp_dir) / ".config" / "meshcore"
         self.config_dir.mkdir(parents=True, exist_ok=True)
+        # get_config_path is memoized; drop any path cached for another home
+        get_config_path.cache_clear()
 
     def tearDown(self):
         """Clean up test fixtures"""
         import shutil
+        get_config_path.cache_clear()
         shutil.rmtree(self.temp_dir, ignore_errors=True)
 
     @patch('pathlib.Path.home')
@@ -210,6 +289,18 @@ class TestConfig(unittest.TestCase):
         loaded_config = load_config()
         self.assertEqual(loaded_config, test_config)
 
+    @patch('builtins.print')
+    @patch('mesh.config.os.replace', side_effect=OSError("disk full"))
+    @patch('pathlib.Path.home')
+    def test_save_config_failure_removes_temp_file(self, mock_home, mock_replace, mock_print):
+        """Test that a failed save doesn't leave the temporary file behind"""
+        mock_home.return_value = Path(self.temp_dir)
+
+        save_config({"host": "127.0.0.1", "port": 5000})
+
+        mock_print.assert_called()
+        self.assertEqual(list(self.config_dir.iterdir()), [])
+
 
 class TestProcessEventMessage(unittest.TestCase):
     """Test process_event_message function"""
@@ -219,6 +310,10 @@ class TestProcessEventMessage(unittest.TestCase):
         self.temp_dir = tempfile.mkdtemp()
         self.history_dir = Path(self.temp_dir) / "history"
         self.history_dir.mkdir(exist_ok=True)
+        # Point the history functions at the temporary directory
+        history_patcher = patch('mesh.messages.HISTORY_DIR', self.history_dir)
+        history_patcher.start()
+        self.addCleanup(history_patcher.stop)
 
     def tearDown(self):
         """Clean up test fixtures"""
@@ -228,189 +323,123 @@ class TestProcessEventMessage(unittest.TestCase):
     @patch('builtins.print')  # Mock print function to avoid console output during tests
     def test_process_event_message_channel(self, mock_print):
         """Test processing channel message events"""
-        # Change history directory temporarily
-        original_history_dir = Path("history")
-        original_history_dir.rename(self.temp_dir + "/original_history") if original_history_dir.exists() else None
-        os.rename(str(self.history_dir), "history")
-
-        try:
-            # Create mock MC object
-            mc = Mock()
-            mc.channels = [{'channel_name': 'test_channel'}]
-            mc.self_info = {'name': 'test_user'}
-            mc.get_contact_by_key_prefix.return_value = {"adv_name": "test_contact"}
-
-            # Create mock event
-            class MockEvent:
-                def __init__(self):
-                    from meshcore import EventType
-                    self.type = EventType.CHANNEL_MSG_RECV
-                    self.payload = {
-                        'type': 'CHAN',
-                        'channel_idx': 0,
-                        'text': 'Test message',
-                        'name': 'test_user',
-                        'pubkey_prefix': 'abc123'
-                    }
-
-            event = MockEvent()
-
-            # Process the event
-            result = process_event_message(mc, event)
-
-            # Verify the result
-            self.assertTrue(result)
-
-            # Verify that a message was printed
-            mock_print.assert_called()
-        finally:
-            # Restore original history directory
-            Path("history").rename(self.temp_dir + "/history_after_test")
-            original_hist_path = Path(self.temp_dir + "/original_history")
-            if original_hist_path.exists():
-                original_hist_path.rename(original_history_dir)
+        # Create mock MC object
+        mc = _make_mc()
 
-    @patch('builtins.print')  # Mock print function to avoid console output during tests
-    def test_process_event_message_private(self, mock_print):
-        """Test processing private message events"""
-        # Change history directory temporarily
-        original_history_dir = Path("history")
-        original_history_dir.rename(self.temp_dir + "/original_history") if original_history_dir.exists() else None
-        os.rename(str(self.history_dir), "history")
-
-        try:
-            # Create mock MC object
-            mc = Mock()
-            mc.channels = [{'channel_name': 'test_channel'}]
-            mc.self_info = {'name': 'test_user'}
-            mc.get_contact_by_key_prefix.return_value = {"adv_name": "test_contact"}
-
-            # Create mock event
-            class MockEvent:
-                def __init__(self):
-                    from meshcore import EventType
-                    self.type = EventType.CONTACT_MSG_RECV
-                    self.payload = {
-                        'type': 'PRIV',
-                        'text': 'Private message',
-                        'name': 'test_user',
-                        'pubkey_prefix': 'abc123'
-                    }
-
-            event = MockEvent()
-
-            # Process the event
-            result = process_event_message(mc, event)
-
-            # Verify the result
-            self.assertTrue(result)
-
-            # Verify that a message was printed
-            mock_print.assert_called()
-        finally:
-            # Restore original history directory
-            Path("history").rename(self.temp_dir + "/history_after_test")
-            original_hist_path = Path(self.temp_dir + "/original_history")
-            if original_hist_path.exists():
-                original_hist_path.rename(original_history_dir)
-
-
-class TestFullscreenInterface(unittest.TestCase):
-    """Test the fullscreen interface functionality"""
+        # Create mock event
+        class MockEvent:
+            def __init__(self):
+                self.type = EventType.CHANNEL_MSG_RECV
+                self.payload = {
+                    'type': 'CHAN',
+                    'channel_idx': 0,
+                    'text': 'Test message',
+                    'name': 'test_user',
+                    'pubkey_prefix': 'abc123'
+                }
 
-    def setUp(self):
-        """Set up test fixtures"""
-        self.temp_dir = tempfile.mkdtemp()
-        self.history_dir = Path(self.temp_dir) / "history"
-        self.history_dir.mkdir(exist_ok=True)
+        event = MockEvent()
 
-    def tearDown(self):
-        """Clean up test fixtures"""
-        import shutil
-        shutil.rmtree(self.temp_dir, ignore_errors=True)
+        # Process the event
+        result = process_event_message(mc, event)
+
+        # Verify the result
+        self.assertTrue(result)
 
-    def test_mesh_chat_app_initialization(self):
-        """Test that MeshChatApp initializes correctly with fullscreen components"""
-        from mesh.meshchat import MeshChatApp
+        # Verify that a message was printed
+        mock_print.assert_called()
 
-        app = MeshChatApp()
+    @patch('builtins.print')  # Mock print function to avoid console output during tests
+    def test_process_event_message_private(self, mock_print):
+        """Test processing private message events"""
+        # Create mock MC object
+        mc = _make_mc()
 
-        # Check that the app has the required attributes
-        self.assertTrue(hasattr(app, 'output_buffer'))
-        self.assertTrue(hasattr(app, 'mc'))
-        self.assertTrue(hasattr(app, 'received_messages'))
-        self.assertTrue(hasattr(app, 'message_queue'))
-        self.assertTrue(hasattr(app, 'last_message_status'))
+        # Create mock event
+        class MockEvent:
+            def __init__(self):
+                self.type = EventType.CONTACT_MSG_RECV
+                self.payload = {
+                    'type': 'PRIV',
+                    'text': 'Private message',
+                    'name': 'test_user',
+                    'pubkey_prefix': 'abc123'
+                }
 
-        # Check that the app has the required UI components
-        self.assertIsNotNone(app.output_buffer_obj)
-        self.assertIsNotNone(app.status_bar)
-        self.assertIsNotNone(app.output_window)
-        self.assertIsNotNone(app.instruction_bar)
-        self.assertIsNotNone(app.input_field)
-        self.assertIsNotNone(app.app)
+        event = MockEvent()
 
-    def test_append_output_updates_buffer(self):
-        """Test that append_output correctly updates the output buffer"""
-        from mesh.meshchat import MeshChatApp
+        # Process the event
+        result = process_event_message(mc, event)
 
-        app = MeshChatApp()
+        # Verify the result
+        self.assertTrue(result)
 
-        initial_buffer = app.output_buffer
-        test_text = "Test message"
+        # Verify that a message was printed
+        mock_print.assert_called()
 
-        app.append_output(test_text)
+    def test_lookup_contact_cached_until_contacts_change(self):
+        """Test that contact lookups are cached while the contact list is unchanged"""
+        mc = _make_mc()
+        mc.contacts = {"abc123def456": {"adv_name": "test_contact"}}
+        lookups = []
+        contacts_by_prefix = {"abc123": {"adv_name": "test_contact"}}
+        mc.get_contact_by_key_prefix = lambda prefix: lookups.append(prefix) or contacts_by_prefix.get(prefix)
 
-        # Check that the buffer was updated
-        self.assertIn(test_text, app.output_buffer)
-        if initial_buffer:
-            self.assertIn("\n", app.output_buffer)
+        self.assertEqual(_lookup_contact(mc, "abc123")["adv_name"], "test_contact")
+        self.assertEqual(_lookup_contact(mc, "abc123")["adv_name"], "test_contact")
+        self.assertEqual(lookups, ["abc123"])
 
-    def test_status_bar_formatting(self):
-        """Test that the status bar formatting works correctly"""
-        from mesh.meshchat import MeshChatApp
+        # A new contact invalidates the cached lookups
+        mc.contacts["fed654cba321"] = {"adv_name": "other_contact"}
+        _lookup_contact(mc, "abc123")
+        self.assertEqual(lookups, ["abc123", "abc123"])
 
-        app = MeshChatApp()
 
-        # Set up some test values
-        app.connected = True
-        app.device_name = "test_device"
-        app.host = "127.0.0.1"
-        app.port = "5000"
-        app.last_message_status = "✓✓"
+class TestAsyncFunctionality(unittest.IsolatedAsyncioTestCase):
+    """Test coroutines and code running inside an event loop"""
 
-        # Get the status bar content
-        status_content = app.get_status_bar()
+    def setUp(self):
+        """Set up test fixtures"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.history_dir = Path(self.temp_dir) / "history"
+        self.history_dir.mkdir(exist_ok=True)
+        # Point the history functions at the temporary directory
+        history_patcher = patch('mesh.messages.HISTORY_DIR', self.history_dir)
+        history_patcher.start()
+        self.addCleanup(history_patcher.stop)
 
-        # Verify that it returns a list of formatted text tuples
-        self.assertIsInstance(status_content, list)
-        self.assertTrue(len(status_content) > 0)
+    def tearDown(self):
+        """Clean up test fixtures"""
+        import shutil
+        # Don't leave a flush scheduled on this test's event loop
+        flush_history()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
 
-        # Check that the content contains the expected elements
-        content_str = "".join([item[1] if isinstance(item, tuple) else str(item) for item in status_content])
-        self.assertIn("CONNECTED", content_str)
-        self.assertIn("test_device", content_str)
-        self.assertIn("127.0.0.1", content_str)
-        self.assertIn("5000", content_str)
-        self.assertIn("MSG: ✓✓", content_str)
+    async def test_save_to_history_buffered_in_event_loop(self):
+        """Test that saves inside an event loop are buffered until flushed"""
+        channel_name = "test_channel"
+        message = "[17-Jan-26 22:46:29] #test_channel: [user] Test message"
 
-    def test_instruction_bar_formatting(self):
-        """Test that the instruction bar formatting works correctly"""
-        from mesh.meshchat import MeshChatApp
+        save_to_history(channel_name, message, check_duplicates=False)
+        log_file = self.history_dir / f"{channel_name}.log"
+        self.assertEqual(log_file.read_text(encoding="utf-8"), "")
 
-        app = MeshChatApp()
+        flush_history()
+        self.assertEqual(log_file.read_text(encoding="utf-8"), message + "\n")
 
-        # Get the instruction bar content
-        instruction_content = app.get_instruction_bar()
+    async def test_send_message_to_channel(self):
+        """Test sending a channel message shows it, sends it and saves it"""
+        mc = _make_mc()
+        mc.commands.send_chan_msg = AsyncMock(return_value=Mock())
+        mc.wait_for_event = AsyncMock(return_value=Mock())
+        output = []
 
-        # Verify that it returns a list of formatted text tuples
-        self.assertIsInstance(instruction_content, list)
-        self.assertTrue(len(instruction_content) > 0)
+        result = await send_message(mc, "#test_channel", "Hello", output.append)
 
-        # Check that the content contains the expected elements
-        content_str = "".join([item[1] if isinstance(item, tuple) else str(item) for item in instruction_content])
-        self.assertIn("Last message:", content_str)
-        self.assertIn("Press Ctrl+C to exit or type '/help' to see available channels/users", content_str)
+        self.assertTrue(result)
+        mc.commands.send_chan_msg.assert_awaited_once_with(0, "Hello")
+        self.assertTrue(output[0].endswith("#test_channel: [test_user] Hello"))
+        self.assertEqual(load_history_from_file("#test_channel"), [output[0]])
 
 
 if __name__ == '__main__':
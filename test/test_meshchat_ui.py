@@ -0,0 +1,190 @@
+import asyncio
+import unittest
+import os
+import tempfile
+from pathlib import Path
+from unittest.mock import patch
+from prompt_toolkit.application import create_app_session
+from prompt_toolkit.input import create_pipe_input
+from prompt_toolkit.output import DummyOutput
+from mesh.meshchat import MeshChatApp
+from mesh.messages import recent_channels
+from mesh.constants import ANSI_END, ANSI_GREEN
+
+
+class TestFullscreenInterface(unittest.TestCase):
+    """Test the fullscreen interface functionality"""
+
+    @classmethod
+    def setUpClass(cls):
+        """Build the application once; constructing the prompt_toolkit UI is costly"""
+        cls.app = MeshChatApp()
+
+    def setUp(self):
+        """Reset the connection fields tests may change"""
+        self.app.connected = False
+        self.app.device_name = "Unknown"
+        self.app.host = "unknown"
+        self.app.port = "unknown"
+        self.app.last_message_status = ""
+
+    def test_mesh_chat_app_initialization(self):
+        """Test that MeshChatApp initializes correctly with fullscreen components"""
+        app = self.app
+
+        # Check that the app has the required attributes
+        self.assertTrue(hasattr(app, 'output_buffer'))
+        self.assertTrue(hasattr(app, 'mc'))
+        self.assertTrue(hasattr(app, 'received_messages'))
+        self.assertTrue(hasattr(app, 'message_queue'))
+        self.assertTrue(hasattr(app, 'last_message_status'))
+
+        # Check that the app has the required UI components
+        self.assertIsNotNone(app.output_buffer_obj)
+        self.assertIsNotNone(app.status_bar)
+        self.assertIsNotNone(app.output_window)
+        self.assertIsNotNone(app.instruction_bar)
+        self.assertIsNotNone(app.input_field)
+        self.assertIsNotNone(app.app)
+
+    def test_append_output_updates_buffer(self):
+        """Test that append_output correctly updates the output buffer"""
+        app = self.app
+
+        initial_buffer = app.output_buffer
+        test_text = "Test message"
+
+        app.append_output(test_text)
+
+        # Check that the buffer was updated
+        self.assertIn(test_text, app.output_buffer)
+        if initial_buffer:
+            self.assertIn("\n", app.output_buffer)
+
+    def test_output_buffer_synced(self):
+        """Test that appended output reaches the displayed buffer without ANSI codes"""
+        app = self.app
+
+        app.append_output(f"{ANSI_GREEN}First{ANSI_END}")
+        app.append_output("Second")
+
+        self.assertTrue(app.output_buffer_obj.text.endswith("First\nSecond"))
+        self.assertTrue(app.output_buffer.endswith(f"{ANSI_GREEN}First{ANSI_END}\nSecond"))
+
+    def test_output_burst_renders_once(self):
+        """Test that a burst of appended output is drawn in a single frame"""
+        async def count_renders():
+            with create_pipe_input() as pipe_input, \
+                    create_app_session(input=pipe_input, output=DummyOutput()):
+                app = MeshChatApp()
+                app_task = asyncio.ensure_future(app.app.run_async())
+                await asyncio.sleep(0.1)
+
+                renders_before = app.app.render_counter
+                for i in range(100):
+                    app.append_output(f"Message {i}")
+                await asyncio.sleep(0.2)
+                renders = app.app.render_counter - renders_before
+
+                app.app.exit()
+                await app_task
+                return app, renders
+
+        app, renders = asyncio.run(count_renders())
+
+        self.assertEqual(renders, 1)
+        self.assertTrue(app.output_buffer_obj.text.endswith("Message 98\nMessage 99"))
+
+    def test_extend_output_appends_lines_in_order(self):
+        """Test that extend_output adds a block of lines with a single refresh request"""
+        app = self.app
+
+        with patch.object(app.app, 'invalidate') as invalidate:
+            app.extend_output([f"{ANSI_GREEN}Old{ANSI_END}", "Older"])
+
+        invalidate.assert_called_once()
+        self.assertTrue(app.output_buffer_obj.text.endswith("Old\nOlder"))
+
+    def test_read_history_files_leaves_recent_names_to_caller(self):
+        """Test that the history worker returns names instead of updating the shared sets"""
+        message = "[17-Jan-26 22:46:29] #worker_channel: [worker_user] Hello"
+        with tempfile.TemporaryDirectory() as temp_dir:
+            history_dir = Path(temp_dir)
+            (history_dir / "worker_channel.log").write_text(message + "\n", encoding="utf-8")
+            with patch('mesh.messages.HISTORY_DIR', history_dir):
+                lines, names = MeshChatApp._read_history_files()
+
+        self.assertEqual(lines, [message])
+        self.assertEqual(names, [("worker_channel", "worker_user")])
+        self.assertNotIn("worker_channel", recent_channels)
+
+    @patch.dict(os.environ, {'MESH_CHAT_SCROLLBACK': '3'})
+    def test_read_history_files_keeps_scrollback_tail(self):
+        """Test that startup history is cut to the scrollback size while it is read"""
+        messages = [f"[17-Jan-26 22:46:{i:02d}] #tail_channel: [user{i % 2}] Message {i}" for i in range(5)]
+        with tempfile.TemporaryDirectory() as temp_dir:
+            history_dir = Path(temp_dir)
+            (history_dir / "tail_channel.log").write_text("\n".join(messages) + "\n", encoding="utf-8")
+            with patch('mesh.messages.HISTORY_DIR', history_dir):
+                lines, names = MeshChatApp._read_history_files()
+
+        self.assertEqual(lines, messages[2:])
+        self.assertEqual(names, [("tail_channel", "user1"), ("tail_channel", "user0")])
+
+    @patch.dict(os.environ, {'MESH_CHAT_SCROLLBACK': '3'})
+    def test_output_scrollback_is_bounded(self):
+        """Test that only the last MESH_CHAT_SCROLLBACK fragments are kept"""
+        # A fresh app, since the scrollback size is read when it's built
+        app = MeshChatApp()
+
+        for i in range(5):
+            app.append_output(f"Message {i}")
+
+        self.assertEqual(app.output_buffer, "Message 2\nMessage 3\nMessage 4")
+        self.assertEqual(app.output_buffer_obj.text, "Message 2\nMessage 3\nMessage 4")
+
+    def test_status_bar_formatting(self):
+        """Test that the status bar formatting works correctly"""
+        app = self.app
+
+        # Set up some test values
+        app.connected = True
+        app.device_name = "test_device"
+        app.host = "127.0.0.1"
+        app.port = "5000"
+        app.last_message_status = "✓✓"
+
+        # Get the status bar content
+        status_content = app.get_status_bar()
+
+        # Verify that it returns a list of formatted text tuples
+        self.assertIsInstance(status_content, list)
+        self.assertTrue(len(status_content) > 0)
+
+        # Check that the content contains the expected elements
+        content_str = "".join([item[1] if isinstance(item, tuple) else str(item) for item in status_content])
+        self.assertIn("CONNECTED", content_str)
+        self.assertIn("test_device", content_str)
+        self.assertIn("127.0.0.1", content_str)
+        self.assertIn("5000", content_str)
+        self.assertIn("MSG: ✓✓", content_str)
+
+    def test_instruction_bar_formatting(self):
+        """Test that the instruction bar formatting works correctly"""
+        app = self.app
+
+        # Get the instruction bar content
+        instruction_content = app.get_instruction_bar()
+
+        # Verify that it returns a list of formatted text tuples
+        self.assertIsInstance(instruction_content, list)
+        self.assertTrue(len(instruction_content) > 0)
+
+        # Check that the content contains the expected elements
+        content_str = "".join([item[1] if isinstance(item, tuple) else str(item) for item in instruction_content])
+        self.assertIn("Last message:", content_str)
+        self.assertIn("Press Ctrl+C to exit or type '/help' to see available channels/users", content_str)
+
+
+if __name__ == '__main__':
+    unittest.main()